@@ -1,39 +1,311 @@
 import pandas as pd
 import yfinance as yf
+from curl_cffi import requests as curl_requests
 from datetime import datetime, timedelta
 import argparse
+import asyncio
+import hashlib
+import importlib.util
 import os
+from pathlib import Path
+
+try:
+    import httpx
+except ImportError:  # httpx is optional; fall back to batched yfinance downloads
+    httpx = None
+
+# Number of symbols requested from Yahoo in a single download call
+BATCH_SIZE = 20
+
+# Yahoo chart endpoint queried directly when httpx is installed
+YAHOO_CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{ticker}'
+
+# Number of chart requests allowed in flight at once
+MAX_CONCURRENT_REQUESTS = 20
+
+# Attempts per chart request, and the delay before the first retry (doubled on each retry)
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 1.0
+
+# HTTP/2 multiplexing needs the h2 package (installed with httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Headers sent with every request to the Yahoo chart endpoint
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# Shared session so yfinance reuses pooled keep-alive connections across calls;
+# curl_cffi (a yfinance dependency) keeps the browser fingerprint Yahoo expects
+SESSION = curl_requests.Session(impersonate='chrome')
+
+# Directory holding previously downloaded stock data
+CACHE_DIR = '.cache'
+
+# How long cached data for a window ending today stays valid
+CACHE_TTL = timedelta(days=1)
+
+def get_cache_path(ticker, start_date, end_date, interval='1d'):
+    """
+    Build the cache file path for a ticker and download window.
+    
+    Parameters:
+    - ticker: str, the Yahoo ticker symbol.
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    - interval: str, the yfinance bar interval.
+    
+    Returns:
+    - Path to the cached Parquet file.
+    """
+    key = hashlib.md5(f"{ticker}|{start_date}|{end_date}|{interval}".encode()).hexdigest()
+    return Path(CACHE_DIR) / ticker / f"{key}.parquet"
+
+def read_from_cache(ticker, start_date, end_date, interval='1d', today=None):
+    """
+    Load cached stock data for a ticker and download window.
+    Windows ending before today never expire; windows ending today expire after CACHE_TTL.
+    
+    Parameters:
+    - ticker: str, the Yahoo ticker symbol.
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    - interval: str, the yfinance bar interval.
+    - today: str, today's date in YYYY-MM-DD format; computed when not given.
+    
+    Returns:
+    - DataFrame containing the cached stock data, or None on a cache miss.
+    """
+    cache_path = get_cache_path(ticker, start_date, end_date, interval)
+    if not cache_path.exists():
+        return None
+    if end_date >= (today or datetime.today().strftime('%Y-%m-%d')):
+        age = datetime.now() - datetime.fromtimestamp(cache_path.stat().st_mtime)
+        if age > CACHE_TTL:
+            return None
+    return pd.read_parquet(cache_path)
+
+def write_to_cache(stock_data, ticker, start_date, end_date, interval='1d'):
+    """
+    Store downloaded stock data for a ticker and download window in the cache.
+    
+    Parameters:
+    - stock_data: DataFrame containing the stock data.
+    - ticker: str, the Yahoo ticker symbol.
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    - interval: str, the yfinance bar interval.
+    """
+    cache_path = get_cache_path(ticker, start_date, end_date, interval)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    stock_data.to_parquet(cache_path)
+
+def download_batch(tickers, start_date, end_date, interval='1d'):
+    """
+    Download stock data for several tickers with a single yfinance call.
+    
+    Parameters:
+    - tickers: list of str, the Yahoo ticker symbols (e.g. 'ITC.NS').
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    - interval: str, the yfinance bar interval.
+    
+    Returns:
+    - dict mapping each ticker to a DataFrame containing its stock data.
+    """
+    data = yf.download(
+        tickers, start=start_date, end=end_date, interval=interval, group_by='ticker',
+        threads=True, progress=False, auto_adjust=False, session=SESSION,
+    )
+    if not isinstance(data.columns, pd.MultiIndex):
+        # Older yfinance versions return flat columns for a single ticker
+        data = pd.concat({tickers[0]: data}, axis=1)
+    return {ticker: data[ticker].dropna(how='all') for ticker in tickers if ticker in data.columns.levels[0]}
+
+def parse_chart(result, interval='1d'):
+    """
+    Convert a Yahoo chart API result into a DataFrame shaped like yfinance's output.
+    
+    Parameters:
+    - result: dict, one entry of the chart response's 'result' list.
+    - interval: str, the bar interval the chart was requested with.
+    
+    Returns:
+    - DataFrame containing the stock data, indexed by Date.
+    """
+    timestamps = result.get('timestamp') or []
+    quote = result['indicators']['quote'][0] if timestamps else {}
+    adjclose = result['indicators'].get('adjclose', [{}])[0].get('adjclose') if timestamps else None
+    index = pd.to_datetime(timestamps, unit='s', utc=True).tz_convert(result['meta']['exchangeTimezoneName']).tz_localize(None)
+    if not interval.endswith(('m', 'h')):
+        # Daily and longer bars are stamped at the market open; keep only the date
+        index = index.normalize()
+    stock_data = pd.DataFrame({
+        'Open': quote.get('open', []),
+        'High': quote.get('high', []),
+        'Low': quote.get('low', []),
+        'Close': quote.get('close', []),
+        'Adj Close': adjclose if adjclose is not None else quote.get('close', []),
+        'Volume': quote.get('volume', []),
+    }, index=pd.Index(index, name='Date'), dtype='float64')
+    return stock_data.dropna(subset=['Open', 'High', 'Low', 'Close'], how='all')
+
+async def fetch_chart(client, semaphore, ticker, start_date, end_date, interval='1d'):
+    """
+    Fetch the stock data for a single ticker from the Yahoo chart endpoint.
+    Rate-limited (429), server (5xx) and connection errors are retried up to MAX_ATTEMPTS times.
+    
+    Parameters:
+    - client: httpx.AsyncClient shared by all requests.
+    - semaphore: asyncio.Semaphore limiting the number of requests in flight.
+    - ticker: str, the Yahoo ticker symbol.
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    - interval: str, the bar interval.
+    
+    Returns:
+    - DataFrame containing the stock data, or None if Yahoo returned no data.
+    
+    Raises:
+    - httpx.HTTPError if the request still fails after all attempts.
+    """
+    params = {
+        'period1': int(pd.Timestamp(start_date).timestamp()),
+        'period2': int(pd.Timestamp(end_date).timestamp()),
+        'interval': interval,
+    }
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            async with semaphore:
+                response = await client.get(YAHOO_CHART_URL.format(ticker=ticker), params=params)
+        except httpx.TransportError:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+        else:
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            if attempt == MAX_ATTEMPTS - 1:
+                response.raise_for_status()
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+    if response.status_code == 404:
+        # Yahoo answers 404 for symbols it does not know
+        return None
+    response.raise_for_status()
+    result = response.json()['chart']['result']
+    if not result:
+        return None
+    return parse_chart(result[0], interval)
+
+async def download_charts(tickers, start_date, end_date, interval='1d'):
+    """
+    Fetch stock data for several tickers concurrently over a shared HTTP connection pool.
+    
+    Parameters:
+    - tickers: list of str, the Yahoo ticker symbols.
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    - interval: str, the bar interval.
+    
+    Returns:
+    - tuple of (dict mapping each ticker to a DataFrame containing its stock data,
+      list of tickers whose requests failed).
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=limits, headers=HEADERS, timeout=30) as client:
+        results = await asyncio.gather(
+            *[fetch_chart(client, semaphore, ticker, start_date, end_date, interval) for ticker in tickers],
+            return_exceptions=True,
+        )
+    stock_data_by_ticker = {}
+    failed = []
+    for ticker, result in zip(tickers, results):
+        if isinstance(result, Exception):
+            print(f"Chart request for {ticker} failed ({result}); falling back to yfinance.")
+            failed.append(ticker)
+        elif result is not None:
+            stock_data_by_ticker[ticker] = result
+    return stock_data_by_ticker, failed
+
+def download_stock_data(tickers, start_date, end_date, interval='1d'):
+    """
+    Download stock data for the given tickers, reusing cached downloads where available.
+    Cache misses are fetched concurrently from the Yahoo chart endpoint when httpx is
+    installed; tickers the endpoint fails on, or all cache misses when httpx is missing,
+    are fetched through yfinance in batches of BATCH_SIZE.
+    
+    Parameters:
+    - tickers: list of str, the Yahoo ticker symbols (e.g. 'ITC.NS').
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    - interval: str, the bar interval.
+    
+    Returns:
+    - dict mapping each ticker to a DataFrame containing its stock data.
+    """
+    today = datetime.today().strftime('%Y-%m-%d')
+    stock_data_by_ticker = {}
+    missing = []
+    for ticker in tickers:
+        cached = read_from_cache(ticker, start_date, end_date, interval, today)
+        if cached is None:
+            missing.append(ticker)
+        else:
+            stock_data_by_ticker[ticker] = cached
+    
+    if missing:
+        if httpx is not None:
+            downloaded, missing = asyncio.run(download_charts(missing, start_date, end_date, interval))
+        else:
+            downloaded = {}
+        # Request the remaining symbols in batches to cut down on HTTP round-trips
+        for i in range(0, len(missing), BATCH_SIZE):
+            downloaded.update(download_batch(missing[i:i + BATCH_SIZE], start_date, end_date, interval))
+        for ticker, stock_data in downloaded.items():
+            if not stock_data.empty:
+                write_to_cache(stock_data, ticker, start_date, end_date, interval)
+            stock_data_by_ticker[ticker] = stock_data
+    
+    return {ticker: stock_data_by_ticker[ticker] for ticker in tickers if ticker in stock_data_by_ticker}
+
+def save_stock_data(stock_data, symbol, output_dir):
+    """
+    Save the stock data for a single symbol to a Parquet file in the output directory.
+    
+    Parameters:
+    - stock_data: DataFrame containing the stock data.
+    - symbol: str, the stock symbol without the exchange suffix.
+    - output_dir: Path, the directory where the Parquet file will be saved.
+    """
+    # Create a Parquet file path
+    parquet_file_path = output_dir / f"{symbol}_stock_data.parquet"
+    
+    # Save the data to a Parquet file
+    stock_data.to_parquet(parquet_file_path, compression='snappy')
+    print(f"Data for {symbol} fetched and saved to {parquet_file_path}.")
 
 def fetch_and_save_stock_data(symbols, n_days, output_dir):
     """
     Fetch stock data for the last n days for given symbols,
-    and save each to individual CSV files in the specified output directory.
+    and save each to individual Parquet files in the specified output directory.
     
     Parameters:
     - symbols: list of str, the stock symbols.
     - n_days: int, the number of days to go back from today.
-    - output_dir: str, path to the directory where CSV files will be saved.
+    - output_dir: str, path to the directory where Parquet files will be saved.
     """
     end_date = datetime.today()
     start_date = end_date - timedelta(days=n_days)
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
     
     # Ensure the output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    for symbol in symbols:
-        if not symbol.endswith('.NS'):
-            symbol += '.NS'
-        
-        # Fetch the stock data
-        stock_data = yf.download(symbol, start=start_date.strftime('%Y-%m-%d'), end=end_date.strftime('%Y-%m-%d'))
-        
-        # Create a CSV file path
-        csv_file_path = os.path.join(output_dir, f"{symbol.split('.')[0]}_stock_data.csv")
-        
-        # Save the data to a CSV file
-        stock_data.to_csv(csv_file_path)
-        print(f"Data for {symbol} fetched and saved to {csv_file_path}.")
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    tickers = [symbol if symbol.endswith('.NS') else symbol + '.NS' for symbol in symbols]
+    stems = {ticker: ticker.split('.')[0] for ticker in tickers}
+    stock_data_by_ticker = download_stock_data(tickers, start_str, end_str)
+    for ticker, stock_data in stock_data_by_ticker.items():
+        save_stock_data(stock_data, stems[ticker], output_path)
 
 def read_symbols_from_csv(file_path):
     """
@@ -45,11 +317,11 @@ def read_symbols_from_csv(file_path):
     Returns:
     - list of str, the stock symbols.
     """
-    df = pd.read_csv(file_path)
+    df = pd.read_csv(file_path, usecols=['symbol'], dtype={'symbol': 'string'})
     return df['symbol'].tolist()
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Fetch NSE stock data for the last n days and save to CSV.")
+    parser = argparse.ArgumentParser(description="Fetch NSE stock data for the last n days and save to Parquet.")
     parser.add_argument('n_days', type=int, help="Number of days to go back from today.")
     parser.add_argument('csv_file', type=str, help="Path to the CSV file containing stock symbols.")
     
@@ -1,63 +1,121 @@
+import numpy as np
 import pandas as pd
-import yfinance as yf
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
 import argparse
 import os
+from pathlib import Path
+from fetch_stock_data import download_stock_data
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to the pandas implementation
+    njit = None
 
 # Define a configurable constant for the percentage threshold
 PERCENTAGE_THRESHOLD = 20  # Example: 20 means 20%
 
-def fetch_stock_data(symbol, start_date, end_date):
+# Price columns used by the group calculations
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+# Number of symbols held in memory and processed together before their results are written out
+SYMBOLS_PER_CHUNK = 100
+
+def fetch_stock_data(symbols, start_date, end_date):
     """
-    Fetch stock data for a given symbol between start_date and end_date.
+    Fetch stock data for the given symbols between start_date and end_date.
+    Cached downloads are reused where available.
     
     Parameters:
-    - symbol: str, the stock symbol.
+    - symbols: list of str, the stock symbols.
     - start_date: str, start date in YYYY-MM-DD format.
     - end_date: str, end date in YYYY-MM-DD format.
     
     Returns:
-    - DataFrame containing the stock data.
+    - DataFrame containing the stock data of all symbols stacked one after another,
+      with a categorical 'Symbol' column.
     """
-    oldSymbol = symbol
-    if not symbol.endswith('.NS'):
-        symbol += '.NS'
-    stock_data = yf.download(symbol, start=start_date, end=end_date)
-    stock_data['Symbol'] = oldSymbol  # Add a column for the stock symbol
+    tickers = {symbol if symbol.endswith('.NS') else symbol + '.NS': symbol for symbol in symbols}
+    stock_data_by_symbol = {
+        tickers[ticker]: stock_data
+        for ticker, stock_data in download_stock_data(list(tickers), start_date, end_date).items()
+        if not stock_data.empty
+    }
+    if not stock_data_by_symbol:
+        return pd.DataFrame()
+    
+    # Only the prices are used downstream; single precision is plenty for them and
+    # halves the memory the group reductions scan
+    stock_data = pd.concat([frame[PRICE_COLUMNS] for frame in stock_data_by_symbol.values()]).astype('float32')
+    # Add a column for the stock symbol
+    codes = np.repeat(np.arange(len(stock_data_by_symbol)), [len(frame) for frame in stock_data_by_symbol.values()])
+    stock_data['Symbol'] = pd.Categorical.from_codes(codes, categories=list(stock_data_by_symbol))
     return stock_data
 
 def mark_keywords(stock_data):
     """
-    Mark each row as 'green' if open price is less than close price, otherwise 'red'.
+    Mark each row as 'green' if open price is less than close price, otherwise 'red',
+    and assign groups to neighboring candles of the same color.
+    Each run of same-colored candles within a symbol gets its own integer GroupID, numbered
+    from 1 across the whole DataFrame.
     
     Parameters:
-    - stock_data: DataFrame containing the stock data.
+    - stock_data: DataFrame containing the stock data, with the rows of each symbol contiguous.
     
     Returns:
-    - DataFrame with an added 'Keyword' column.
+    - DataFrame with added categorical 'Keyword' and 'GroupID' columns.
     """
-    stock_data['Keyword'] = stock_data.apply(lambda row: 'green' if row['Open'] < row['Close'] else 'red', axis=1)
+    is_green = stock_data['Open'].to_numpy() < stock_data['Close'].to_numpy()
+    symbol_codes = stock_data['Symbol'].cat.codes.to_numpy()
+    # A new group starts at the first row and wherever the color or the symbol changes
+    group_starts = np.ones(len(is_green), dtype=bool)
+    group_starts[1:] = (is_green[1:] != is_green[:-1]) | (symbol_codes[1:] != symbol_codes[:-1])
+    stock_data['Keyword'] = pd.Categorical.from_codes((~is_green).astype('int8'), categories=['green', 'red'])
+    stock_data['GroupID'] = np.cumsum(group_starts)
     return stock_data
 
-def assign_groups(stock_data):
+def _percentage_difference_kernel(group_id, low, high):
     """
-    Assign groups to neighboring green and red candles.
-    Green groups are named 'green 1', 'green 2', etc., and all red groups are named 'red'.
+    Compute the group percentage difference of every row in a single sweep.
     
     Parameters:
-    - stock_data: DataFrame containing the stock data.
+    - group_id: ndarray of int, the GroupID of each row; groups are consecutive runs.
+    - low: ndarray of float, the Low prices.
+    - high: ndarray of float, the High prices.
     
     Returns:
-    - DataFrame with added 'Group' and 'GroupID' columns.
+    - ndarray of the percentage difference of each row's group.
     """
-    stock_data['GroupID'] = (stock_data['Keyword'] != stock_data['Keyword'].shift()).cumsum()
-    stock_data['Group'] = stock_data['Keyword'].str.cat(stock_data['GroupID'].astype(str), sep='_')
+    n = len(group_id)
+    percentage_diff = np.empty_like(low)
+    start = 0
+    lowest_low = np.nan
+    highest_high = np.nan
+    for i in range(n + 1):
+        if i == n or (i > 0 and group_id[i] != group_id[i - 1]):
+            # Close the current group and back-fill its percentage difference
+            for j in range(start, i):
+                percentage_diff[j] = ((highest_high - lowest_low) / lowest_low) * 100
+            if i == n:
+                break
+            start = i
+            lowest_low = np.nan
+            highest_high = np.nan
+        # NaN prices are skipped, matching the pandas min/max reductions
+        if low[i] < lowest_low or np.isnan(lowest_low):
+            lowest_low = low[i]
+        if high[i] > highest_high or np.isnan(highest_high):
+            highest_high = high[i]
+    return percentage_diff
 
-    return stock_data
+percentage_difference_kernel = njit(cache=True)(_percentage_difference_kernel) if njit is not None else None
 
 def calculate_percentage_differences(stock_data):
     """
     Calculate the percentage difference between the highest High and the lowest Low for each group.
+    Uses the numba kernel when numba is installed, otherwise NumPy reductions over the
+    factorized GroupIDs.
     
     Parameters:
     - stock_data: DataFrame containing the stock data.
@@ -65,14 +123,28 @@ def calculate_percentage_differences(stock_data):
     Returns:
     - DataFrame with an added 'PercentageDifference' column.
     """
-    percentage_diffs = []
-    for group_id in stock_data['GroupID'].unique():
-        group_data = stock_data[stock_data['GroupID'] == group_id]
-        lowest_low = group_data['Low'].min()
-        highest_high = group_data['High'].max()
+    if percentage_difference_kernel is not None:
+        stock_data['PercentageDifference'] = percentage_difference_kernel(
+            stock_data['GroupID'].to_numpy(),
+            stock_data['Low'].to_numpy(),
+            stock_data['High'].to_numpy(),
+        )
+        return stock_data
+    # Map the GroupIDs to dense 0..G-1 codes and reduce each group into a (G,) buffer;
+    # fmin/fmax skip NaN prices, matching the pandas min/max reductions
+    codes, uniques = pd.factorize(stock_data['GroupID'], sort=False)
+    low = stock_data['Low'].to_numpy()
+    high = stock_data['High'].to_numpy()
+    lowest_low = np.full(len(uniques), np.inf, dtype=low.dtype)
+    highest_high = np.full(len(uniques), -np.inf, dtype=high.dtype)
+    np.fmin.at(lowest_low, codes, low)
+    np.fmax.at(highest_high, codes, high)
+    # Groups with no prices at all keep their infinite seeds; report NaN for them as pandas does
+    lowest_low[np.isinf(lowest_low)] = np.nan
+    highest_high[np.isinf(highest_high)] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
         percentage_diff = ((highest_high - lowest_low) / lowest_low) * 100
-        percentage_diffs.extend([percentage_diff] * len(group_data))
-    stock_data['PercentageDifference'] = percentage_diffs
+    stock_data['PercentageDifference'] = percentage_diff[codes]
     return stock_data
 
 def identify_valid_groups(stock_data):
@@ -84,70 +156,112 @@ def identify_valid_groups(stock_data):
     - stock_data: DataFrame containing the stock data.
     
     Returns:
-    - DataFrame with an added 'ValidGroup' column.
-    """
-    valid_groups = []
-    for group_name in stock_data['Group'].unique():
-        if 'green' in group_name:
-            group_data = stock_data[stock_data['Group'] == group_name]
-            if group_data['PercentageDifference'].iloc[0] >= PERCENTAGE_THRESHOLD:
-                valid_groups.append(group_name)
-    stock_data['ValidGroup'] = stock_data['Group'].apply(lambda x: x if x in valid_groups else '')
-    return stock_data
+    - tuple of (DataFrame with an added 'ValidGroup' column holding the GroupID of valid groups
+      and 0 otherwise, boolean Series marking the rows in valid groups).
+    """
+    # PercentageDifference is constant within a group, so the test can be applied per row
+    valid_mask = stock_data['Keyword'].eq('green') & (stock_data['PercentageDifference'] >= PERCENTAGE_THRESHOLD)
+    stock_data['ValidGroup'] = stock_data['GroupID'].where(valid_mask, 0)
+    return stock_data, valid_mask
 
-def remove_invalid_rows(stock_data):
+def remove_invalid_rows(stock_data, valid_mask):
     """
-    Remove rows that have an empty ValidGroup column.
+    Remove rows that do not belong to a valid group.
     
     Parameters:
     - stock_data: DataFrame containing the stock data.
+    - valid_mask: boolean Series from identify_valid_groups marking the rows in valid groups.
     
     Returns:
-    - DataFrame with rows having empty ValidGroup removed.
+    - DataFrame with rows outside valid groups removed.
     """
-    return stock_data[stock_data['ValidGroup'] != '']
+    return stock_data.loc[valid_mask].copy()
 
 def transform_valid_groups(stock_data):
     """
     Transform each valid group into a single row with specified columns.
     
     Parameters:
-    - stock_data: DataFrame containing the stock data.
+    - stock_data: DataFrame containing only the rows of valid groups.
     
     Returns:
     - DataFrame with transformed rows.
     """
-    transformed_data = []
-    for group_name in stock_data['ValidGroup'].unique():
-        if group_name:
-            group_data = stock_data[stock_data['ValidGroup'] == group_name]
-            symbol = group_data['Symbol'].iloc[0]
-            lowest_low = group_data['Low'].min()
-            highest_high = group_data['High'].max()
-            earliest_date = group_data.index.min()
-            percentage_diff = group_data['PercentageDifference'].iloc[0]
-            transformed_data.append({
-                'Symbol': symbol,
-                'Lowest Low': lowest_low,
-                'Highest High': highest_high,
-                'Earliest Date': earliest_date,
-                'Percentage Difference': percentage_diff,
-                'ValidGroup': group_name
-            })
-    return pd.DataFrame(transformed_data)
-
-def save_to_csv(stock_data, symbol, output_dir):
-    """
-    Save the stock data to a CSV file in the specified output directory.
+    stock_data = stock_data.rename_axis('Date').reset_index()
+    transformed_data = stock_data.groupby('ValidGroup', sort=False).agg(**{
+        'Symbol': ('Symbol', 'first'),
+        'Lowest Low': ('Low', 'min'),
+        'Highest High': ('High', 'max'),
+        'Earliest Date': ('Date', 'min'),
+        'Percentage Difference': ('PercentageDifference', 'first'),
+    }).reset_index()
+    return transformed_data[['Symbol', 'Lowest Low', 'Highest High', 'Earliest Date', 'Percentage Difference', 'ValidGroup']]
+
+def process_stock_data(stock_data):
+    """
+    Reduce the stacked stock data of all symbols to their valid green groups.
     
     Parameters:
     - stock_data: DataFrame containing the stock data.
-    - symbol: str, the stock symbol.
-    - output_dir: str, path to the directory where CSV files will be saved.
+    
+    Returns:
+    - DataFrame with one row per valid group.
     """
-    csv_file_path = os.path.join(output_dir, f"{symbol.split('.')[0]}_stock_data.csv")
-    stock_data.to_csv(csv_file_path)
-    print(f"Data for {symbol} fetched and saved to {csv_file_path}.")
+    stock_data = mark_keywords(stock_data)
+    stock_data = calculate_percentage_differences(stock_data)
+    stock_data, valid_mask = identify_valid_groups(stock_data)
+    stock_data = remove_invalid_rows(stock_data, valid_mask)
+    return transform_valid_groups(stock_data)
+
+def iter_valid_groups(symbols, start_date, end_date):
+    """
+    Fetch and process the stock data SYMBOLS_PER_CHUNK symbols at a time.
+    
+    Parameters:
+    - symbols: list of str, the stock symbols.
+    - start_date: str, start date in YYYY-MM-DD format.
+    - end_date: str, end date in YYYY-MM-DD format.
+    
+    Yields:
+    - DataFrame with one row per valid group for each chunk of symbols.
+    """
+    # Drop repeated symbols so none is fetched and reported twice across chunks
+    symbols = list(dict.fromkeys(symbols))
+    for i in range(0, len(symbols), SYMBOLS_PER_CHUNK):
+        stock_data = fetch_stock_data(symbols[i:i + SYMBOLS_PER_CHUNK], start_date, end_date)
+        if not stock_data.empty:
+            yield process_stock_data(stock_data)
+
+def save_to_parquet(frames, symbol, output_dir):
+    """
+    Stream DataFrames into a single Parquet file in the specified output directory.
+    Each DataFrame is written as it arrives, so only one is held in memory at a time.
+    
+    Parameters:
+    - frames: iterable of DataFrames sharing the same columns.
+    - symbol: str, the stock symbol without the exchange suffix.
+    - output_dir: Path, the directory where Parquet files will be saved.
+    """
+    parquet_file_path = output_dir / f"{symbol}_stock_data.parquet"
+    writer = None
+    try:
+        for stock_data in frames:
+            if stock_data.empty:
+                continue
+            # Categoricals from different chunks have different dictionaries; store plain strings
+            stock_data = stock_data.astype({'Symbol': str})
+            if writer is None:
+                table = pa.Table.from_pandas(stock_data, preserve_index=False)
+                writer = pq.ParquetWriter(parquet_file_path, table.schema, compression='snappy')
+            else:
+                table = pa.Table.from_pandas(stock_data, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame().to_parquet(parquet_file_path, compression='snappy')
+    print(f"Data for {symbol} fetched and saved to {parquet_file_path}.")
 
 def read_symbols_from_csv(file_path):
     """
@@ -159,42 +273,35 @@ def read_symbols_from_csv(file_path):
     Returns:
     - list of str, the stock symbols.
     """
-    df = pd.read_csv(file_path)
+    df = pd.read_csv(file_path, usecols=['symbol'], dtype={'symbol': 'string'})
     return df['symbol'].tolist()
 
 def main(n_days, csv_file, output_dir):
     """
-    Main function to fetch NSE stock data for the last n days and save to CSV.
+    Main function to fetch NSE stock data for the last n days and save to Parquet.
     
     Parameters:
     - n_days: int, the number of days to go back from today.
     - csv_file: str, path to the CSV file containing stock symbols.
-    - output_dir: str, path to the directory where CSV files will be saved.
+    - output_dir: str, path to the directory where Parquet files will be saved.
     """
     end_date = datetime.today()
     start_date = end_date - timedelta(days=n_days)
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
     
     # Ensure the output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
     
     symbols = read_symbols_from_csv(csv_file)
-    combined_data = pd.DataFrame()
-    
-    for symbol in symbols:
-        stock_data = fetch_stock_data(symbol, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
-        stock_data = mark_keywords(stock_data)
-        stock_data = assign_groups(stock_data)
-        stock_data = calculate_percentage_differences(stock_data)
-        stock_data = identify_valid_groups(stock_data)
-        stock_data = remove_invalid_rows(stock_data)
-        stock_data = transform_valid_groups(stock_data)
-        combined_data = pd.concat([combined_data, stock_data])
     
-    save_to_csv(combined_data, "Combined", output_dir)
+    # Each chunk of symbols is processed as a single stacked DataFrame and written out
+    # before the next one is fetched, keeping memory flat regardless of the number of symbols
+    save_to_parquet(iter_valid_groups(symbols, start_str, end_str), "Combined", output_path)
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Fetch NSE stock data for the last n days and save to CSV.")
+    parser = argparse.ArgumentParser(description="Fetch NSE stock data for the last n days and save to Parquet.")
     parser.add_argument('n_days', type=int, help="Number of days to go back from today.")
     parser.add_argument('csv_file', type=str, help="Path to the CSV file containing stock symbols.")
     